@@ -1,79 +1,185 @@
-from typing import Optional, List, Literal
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Coroutine, Dict, Optional, List, Literal, Sequence, TypeVar
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+try:  # optional: faster event loop for the async fan-out (not on Windows)
+    import uvloop
+except ImportError:
+    uvloop = None
 
 load_dotenv()
+# One client for the whole process: its sync and async (client.aio) HTTP
+# clients each keep a connection pool, so don't construct per-request clients.
 client = genai.Client()
 
+T = TypeVar("T")
+
+MODEL_ID = "gemini-3-flash-preview"
+
+# Async fan-out: concurrent in-flight requests and retry attempts per video
+MAX_CONCURRENCY = 8
+MAX_ATTEMPTS = 4
+
+# Persistent result cache. Bump SCHEMA_VERSION whenever VideoAnalysis or the
+# prompt changes so stale entries are no longer hit.
+CACHE_DIR = Path("./.gemini_cache")
+SCHEMA_VERSION = 2
+
+# Output cap per call; the JSON reply is a few sentences plus a short list
+MAX_OUTPUT_TOKENS = 512
+TEMPERATURE = 0.4
+
+# Batch API polling
+BATCH_POLL_S = 30
+BATCH_TERMINAL_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
 
 class VideoAnalysis(BaseModel):
+    # Descriptions are inlined into the schema Gemini sees; keep them terse.
     status: Literal["clear", "inconclusive", "multiple_subjects"] = Field(
         description=(
-            "Classify whether the video content is clearly understandable. "
-            "'clear' if the main subject/action is identifiable, "
-            "'multiple_subjects' if there are several distinct focal subjects, "
-            "'inconclusive' if the content cannot be determined from the video."
+            "clear: subject identifiable; multiple_subjects: several focal "
+            "subjects; inconclusive: cannot tell."
         )
     )
     main_story: str = Field(
-        description=(
-            "A warm, concise 2–3 sentence description of what happens in the video, "
-            "including the mood and any notable moment. Do not assume details not visible."
-        )
+        description="2–3 warm sentences: what visibly happens, mood, notable moment."
     )
     kitten_details: Optional[List[str]] = Field(
         default=None,
-        description=(
-            "Optional short bullet points of distinct visual details (e.g., colors, objects, "
-            "clothing, animals, setting). Leave null if not applicable."
-        ),
+        description="Short distinct visual details (colors, objects, setting), or null.",
     )
 
 
+def build_contents(url: str) -> List[str]:
+    return [
+        f"Video: {url}\n"
+        "Describe it warmly and naturally in 2–3 sentences: what visibly happens, "
+        "the mood, and any notable moment. Don't assume the subject unless clearly "
+        "visible. List distinct visual details if any."
+    ]
+
+
+# Built once at import: the JSON schema is sent as a plain dict, so the SDK
+# doesn't walk the Pydantic model on every call, and replies are validated
+# straight from the response text by a prebuilt TypeAdapter.
+_SCHEMA: Dict[str, Any] = VideoAnalysis.model_json_schema()
+_ADAPTER: TypeAdapter[VideoAnalysis] = TypeAdapter(VideoAnalysis)
+_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_json_schema=_SCHEMA,
+    max_output_tokens=MAX_OUTPUT_TOKENS,
+    temperature=TEMPERATURE,
+    thinking_config=types.ThinkingConfig(
+        include_thoughts=False, thinking_level="minimal"
+    ),
+)
+
+
+def to_analysis(payload: str | bytes | Any) -> VideoAnalysis | None:
+    """
+    Validate a reply (raw JSON text or an already-decoded object); drop it
+    when the video is inconclusive.
+    """
+    if not payload:
+        print("⚠️ No parsed payload returned.")
+        return None
+
+    if isinstance(payload, VideoAnalysis):
+        data = payload
+    elif isinstance(payload, (str, bytes)):
+        data = _ADAPTER.validate_json(payload)
+    else:
+        data = _ADAPTER.validate_python(payload)
+
+    if data.status == "inconclusive":
+        print("⚠️ Video marked as inconclusive. Skipping...")
+        return None
+
+    return data
+
+
+# ----------------------------- Result cache ---------------------------------
+
+
+def cache_key(url: str) -> str:
+    """
+    Key a video by URL, or by streamed content hash for local files, with
+    SCHEMA_VERSION folded in.
+    """
+    h = hashlib.sha256(f"v{SCHEMA_VERSION}\0".encode())
+    if os.path.isfile(url):
+        with open(url, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        h.update(url.encode("utf-8"))
+    return h.hexdigest()
+
+
+def cache_get(key: str) -> VideoAnalysis | None:
+    path = CACHE_DIR / f"{key}.json"
+    try:
+        return _ADAPTER.validate_json(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable cache entry {path.name}: {e}")
+        return None
+
+
+def cache_put(key: str, data: VideoAnalysis) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = CACHE_DIR / f"{key}.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(data.model_dump_json(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
 def process_kitten_video(url: str) -> VideoAnalysis | None:
     print(f"\n🎥 Analyzing: {url}")
 
+    key = cache_key(url)
+    cached = cache_get(key)
+    if cached is not None:
+        print("📦 Using cached analysis")
+        return cached
+
     try:
-        contents = [
-            f"Analyze this video: {url}",
-            (
-                "Describe the video content in a warm, natural tone suitable for a short summary. "
-                "Focus on what is visually happening, the mood, and any notable moments. "
-                "Do not assume the subject unless clearly visible."
-            ),
-        ]
+        contents = build_contents(url)
 
         print("\n🧾 PROMPT CONTENTS:")
         for i, c in enumerate(contents, 1):
             print(f"[{i}] {c}")
 
         response = client.models.generate_content(
-            model="gemini-3-flash-preview",
+            model=MODEL_ID,
             contents=contents,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=VideoAnalysis,
-                thinking_config=types.ThinkingConfig(
-                    include_thoughts=False, thinking_level="minimal"
-                ),
-            ),
+            config=_CONFIG,
         )
-        parsed = response.parsed
-        if parsed is None:
-            print("⚠️ No parsed payload returned.")
-            return None
-
-        if isinstance(parsed, VideoAnalysis):
-            data = parsed
-        else:
-            data = VideoAnalysis.model_validate(parsed)
-
-        if data.status == "inconclusive":
-            print("⚠️ Video marked as inconclusive. Skipping...")
-            return None
-
+        data = to_analysis(response.text)
+        if data is not None:
+            cache_put(key, data)
         return data
 
     except Exception as e:
@@ -81,14 +187,193 @@ def process_kitten_video(url: str) -> VideoAnalysis | None:
         return None
 
 
+# ----------------------------- Async fan-out --------------------------------
+
+
+def _is_retryable(e: BaseException) -> bool:
+    """Retry on rate limits (429) and server-side errors (5xx)."""
+    if not isinstance(e, errors.APIError):
+        return False
+    code = e.code or 0
+    return code == 429 or code >= 500
+
+
+async def process_kitten_video_async(
+    url: str, sem: asyncio.Semaphore, client: genai.Client
+) -> VideoAnalysis | None:
+    """Async variant of process_kitten_video; `sem` bounds in-flight requests."""
+    key = cache_key(url)
+    cached = cache_get(key)
+    if cached is not None:
+        print(f"📦 Using cached analysis: {url}")
+        return cached
+
+    async with sem:
+        print(f"\n🎥 Analyzing: {url}")
+
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(MAX_ATTEMPTS),
+                wait=wait_exponential_jitter(),
+                retry=retry_if_exception(_is_retryable),
+                reraise=True,
+            ):
+                with attempt:
+                    response = await client.aio.models.generate_content(
+                        model=MODEL_ID,
+                        contents=build_contents(url),
+                        config=_CONFIG,
+                    )
+            data = to_analysis(response.text)
+            if data is not None:
+                cache_put(key, data)
+            return data
+
+        except Exception as e:
+            print(f"❌ Error ({url}): {e}")
+            return None
+
+
+async def process_kitten_videos_async(
+    urls: Sequence[str], max_concurrency: int = MAX_CONCURRENCY
+) -> List[VideoAnalysis | None]:
+    """Analyze videos concurrently; results are returned in input order."""
+    sem = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(
+        *(process_kitten_video_async(u, sem, client) for u in urls)
+    )
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """asyncio.run, on uvloop when it is installed."""
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
+# ----------------------------- Batch API ------------------------------------
+
+
+def build_request(url: str) -> Dict[str, Any]:
+    """
+    Build one Batch API JSONL line for a video URL.
+
+    The URL doubles as the request key so results can be matched back.
+    """
+    return {
+        "key": url,
+        "request": {
+            "contents": [
+                {"role": "user", "parts": [{"text": c} for c in build_contents(url)]}
+            ],
+            "generation_config": {
+                "response_mime_type": "application/json",
+                "response_json_schema": _SCHEMA,
+                "max_output_tokens": MAX_OUTPUT_TOKENS,
+                "temperature": TEMPERATURE,
+                "thinking_config": {
+                    "include_thoughts": False,
+                    "thinking_level": "minimal",
+                },
+            },
+        },
+    }
+
+
+def _response_text(response: Dict[str, Any]) -> str:
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(p.get("text", "") for p in parts if not p.get("thought"))
+
+
+def run_batch(
+    urls: Sequence[str], poll_s: float = BATCH_POLL_S
+) -> Dict[str, VideoAnalysis | None]:
+    """
+    Analyze many videos through a single Gemini Batch API job.
+
+    Writes one JSONL request per URL, uploads it, polls the job until it
+    reaches a terminal state, then parses each result line. Videos already in
+    the result cache are not resubmitted. Returns a dict keyed by URL; failed
+    or inconclusive videos map to None.
+    """
+    results: Dict[str, VideoAnalysis | None] = {}
+    keys: Dict[str, str] = {}
+    for url in dict.fromkeys(urls):
+        keys[url] = cache_key(url)
+        results[url] = cache_get(keys[url])
+
+    urls = [url for url, data in results.items() if data is None]
+    if not urls:
+        return results
+
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".jsonl", encoding="utf-8", delete=False
+    ) as f:
+        for url in urls:
+            f.write(json.dumps(build_request(url), ensure_ascii=False) + "\n")
+        jsonl_path = f.name
+
+    try:
+        uploaded = client.files.upload(file=jsonl_path, config={"mime_type": "jsonl"})
+    finally:
+        os.unlink(jsonl_path)
+
+    job = client.batches.create(model=MODEL_ID, src=uploaded.name)
+    print(f"📨 Submitted batch job {job.name} ({len(urls)} video(s))")
+
+    while True:
+        job = client.batches.get(name=job.name)
+        state = job.state.name if job.state else None
+        if state in BATCH_TERMINAL_STATES:
+            break
+        print(f"⏳ Batch state: {state}", end="\r")
+        time.sleep(poll_s)
+
+    if state != "JOB_STATE_SUCCEEDED":
+        raise RuntimeError(f"❌ Batch job {job.name} ended with state={state}")
+
+    raw = client.files.download(file=job.dest.file_name)
+
+    for line in raw.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        url = row.get("key")
+        if row.get("error"):
+            print(f"❌ Error for {url}: {row['error']}")
+            continue
+        try:
+            text = _response_text(row.get("response") or {})
+            data = to_analysis(text)
+        except Exception as e:
+            print(f"❌ Error for {url}: {e}")
+            continue
+        if url in results and data is not None:
+            results[url] = data
+            cache_put(keys[url], data)
+
+    return results
+
+
 if __name__ == "__main__":
     vids = [
         # "https://youtu.be/S3JmDnsPWE8",
         "https://youtu.be/S3JmDnsPWE8"
     ]
 
-    for v in vids:
-        result = process_kitten_video(v)
+    # Batch API: half price, results within the batch window.
+    # Set to False for immediate results via concurrent per-video calls.
+    use_batch = True
+
+    if use_batch:
+        results = list(run_batch(vids).values())
+    else:
+        results = run_async(process_kitten_videos_async(vids))
+
+    for result in results:
         if result:
             print(result)
             # print(f"✅ STATUS: {result.status}")
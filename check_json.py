@@ -1,10 +1,9 @@
 from pathlib import Path
-import json
+import orjson
 
 file_path = Path("./site/assets/kittens.json")
 
-with open(file=file_path) as f:
-    data = json.load(f)
+data = orjson.loads(file_path.read_bytes())
 
 print(type(data))
 
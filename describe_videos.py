@@ -22,17 +22,19 @@ wanted = [
 
 week_dirs = [temp_media_dir / w for w in weeks]
 
-videos = []
-for wd in week_dirs:
-    for name in wanted:
-        p = wd / name
-        if p.exists():
-            videos.append(p)
+# dict.fromkeys dedups `wanted` (keeping order) so each file is checked once
+videos = sorted(
+    {
+        p
+        for wd in week_dirs
+        for name in dict.fromkeys(wanted)
+        if (p := wd / name).is_file()
+    }
+)
 
 if not videos:
     print("❌ No videos found for selected weeks + filters")
 
-videos = sorted(set(videos))
 print("videos to process:")
 for v in videos:
     print(" -", v)
@@ -17,23 +17,44 @@ python file_scan_utils.py \
   --ffprobe-timeout 5 \
   --progress-every 200 \
   --log "/mnt/h/osmo_media_scan_errors.log"
+
+Add --watch to keep the CSV current after the initial scan: only files that
+change are re-stat'ed / re-probed (needs `pip install watchdog`).
 """
 
 from __future__ import annotations
 
+from array import array
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import argparse
+import csv
+import os
+import queue
+import stat
 import subprocess
-from typing import Optional, Sequence
+import time
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
+try:  # optional: only needed for --watch
+    from watchdog.events import FileSystemEvent, FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = None
+
 
 VIDEO_EXTS_DEFAULT = {".mp4", ".mov", ".mkv", ".avi", ".m4v", ".wmv"}
+NAN = float("nan")
 
+# Probe cache entry: (size_bytes, mtime_ns, fps, ffprobe_status), keyed by abs path
+ProbeEntry = Tuple[int, int, Optional[float], str]
 
-def get_fps_ffprobe(path: Path, timeout_s: int) -> Optional[float]:
+
+def get_fps_ffprobe(path: str | Path, timeout_s: int) -> Optional[float]:
     """
     Use ffprobe to read avg_frame_rate and return fps as float.
 
@@ -79,34 +100,145 @@ def get_fps_ffprobe(path: Path, timeout_s: int) -> Optional[float]:
         return None
 
 
-def scan_files(
+def load_probe_cache(cache_path: Path) -> Dict[str, ProbeEntry]:
+    """Load the ffprobe sidecar cache; a missing or unreadable file yields {}."""
+    if not cache_path.exists():
+        return {}
+    try:
+        df = pd.read_parquet(cache_path)
+    except Exception as e:
+        print(f"[cache] ignoring unreadable {cache_path}: {e}")
+        return {}
+
+    fps = df["fps"].astype(object).where(df["fps"].notna(), None)
+    return {
+        path: (int(size), int(mtime_ns), f, status)
+        for path, size, mtime_ns, f, status in zip(
+            df["path"], df["size_bytes"], df["mtime_ns"], fps, df["ffprobe_status"]
+        )
+    }
+
+
+def save_probe_cache(cache_path: Path, entries: Dict[str, ProbeEntry]) -> None:
+    """Write the ffprobe sidecar cache atomically (tmp file + os.replace)."""
+    df = pd.DataFrame(
+        [(path, *entry) for path, entry in entries.items()],
+        columns=["path", "size_bytes", "mtime_ns", "fps", "ffprobe_status"],
+    )
+    df["fps"] = df["fps"].astype("float64")
+    tmp = cache_path.with_name(cache_path.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, cache_path)
+
+
+def _local_dt(mtime_ns: int) -> datetime:
+    """mtime_ns -> local naive datetime rounded to microseconds (as in scan_files)."""
+    us = (mtime_ns + 500) // 1000
+    return datetime.fromtimestamp(us // 1_000_000).replace(microsecond=us % 1_000_000)
+
+
+class ScanRow(NamedTuple):
+    path: str
+    name: str
+    ext: str
+    mtime_ns: int
+    size_bytes: int
+    fps: Optional[float]
+    ffprobe_status: str
+
+    def to_record(self) -> dict:
+        """Row as written to the output CSV (same columns as scan_files)."""
+        return {
+            "path": self.path,
+            "name": self.name,
+            "ext": self.ext,
+            # formatted like DataFrame.to_csv does (always with microseconds),
+            # not str(datetime), which drops ".000000" on whole seconds
+            "modified_time": _local_dt(self.mtime_ns).isoformat(
+                sep=" ", timespec="microseconds"
+            ),
+            "size_bytes": self.size_bytes,
+            "fps": self.fps,
+            "ffprobe_status": self.ffprobe_status,
+        }
+
+
+COLUMNS = [
+    "path",
+    "name",
+    "ext",
+    "modified_time",
+    "size_bytes",
+    "fps",
+    "ffprobe_status",
+]
+
+
+def _walk(root: str, exclude: frozenset[str] = frozenset()) -> Iterator[os.DirEntry]:
+    """
+    Yield every non-directory entry under root using os.scandir.
+
+    Iterative (no recursion limit); symlinked directories are not followed,
+    matching Path.rglob. Unreadable directories are skipped, and so are
+    directories whose absolute path is in `exclude` (the whole subtree is
+    pruned before it is listed).
+    """
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        if not exclude or os.path.abspath(e.path) not in exclude:
+                            stack.append(e.path)
+                    else:
+                        yield e
+        except OSError:
+            continue
+
+
+def _norm_exts(exts: Sequence[str]) -> frozenset[str]:
+    # Normalize extensions: allow "mp4" or ".mp4"
+    out = set()
+    for e in exts:
+        e = e.lower()
+        if not e.startswith("."):
+            e = "." + e
+        out.add(e)
+    return frozenset(out)
+
+
+def iter_scan_files(
     dir_path: str | Path,
     exts: Sequence[str],
     ffprobe_timeout_s: int = 5,
     progress_every: int = 0,
     log_path: Optional[str | Path] = None,
     video_exts: Optional[set[str]] = None,
-) -> pd.DataFrame:
+    ffprobe_workers: Optional[int] = None,
+    cache_path: Optional[str | Path] = None,
+    exclude: Optional[Sequence[str | Path]] = None,
+) -> Iterator[ScanRow]:
     """
-    Scan directory recursively and return DataFrame with:
-    - path (full path)
-    - name
-    - ext
-    - modified_time (mtime)   # used as "shoot time" proxy if file untouched
-    - size_bytes
-    - fps (videos only; None otherwise or on failure/timeout)
-    - ffprobe_status ("ok" | "skip" | "timeout_or_error")
+    Stream ScanRow records for matching files under dir_path (unsorted).
+
+    Memory stays bounded: non-video rows are yielded as soon as they are
+    stat'ed, and videos are probed in batches of a few per worker on a
+    thread pool, then yielded. See scan_files for the argument semantics.
     """
     dir_path = Path(dir_path)
     video_exts = video_exts or set(VIDEO_EXTS_DEFAULT)
+    norm_exts = _norm_exts(exts)
+    excluded = frozenset(os.path.abspath(p) for p in (exclude or ()))
+    workers = ffprobe_workers or min(16, (os.cpu_count() or 4) * 2)
+    batch_size = workers * 8
 
-    # Normalize extensions: allow "mp4" or ".mp4"
-    norm_exts: list[str] = []
-    for e in exts:
-        e = e.lower()
-        if not e.startswith("."):
-            e = "." + e
-        norm_exts.append(e)
+    cache: Dict[str, ProbeEntry] = {}
+    if cache_path:
+        cache_path = Path(cache_path)
+        cache = load_probe_cache(cache_path)
+    new_cache: Dict[str, ProbeEntry] = {}
 
     log_f = None
     if log_path:
@@ -118,59 +250,187 @@ def scan_files(
             log_f.write(msg.rstrip() + "\n")
             log_f.flush()
 
-    rows = []
     scanned = 0
     matched = 0
+    probed = 0
+    pending: list[Tuple[ScanRow, str]] = []  # (row, abs path) awaiting ffprobe
+
+    def flush(ex: ThreadPoolExecutor) -> Iterator[ScanRow]:
+        nonlocal probed
+        # ffprobe is subprocess-bound, so threads overlap the spawns cleanly
+        futures = {
+            ex.submit(get_fps_ffprobe, row.path, ffprobe_timeout_s): (
+                row,
+                abs_path,
+            )
+            for row, abs_path in pending
+        }
+        pending.clear()
+        for fut in as_completed(futures):
+            row, abs_path = futures[fut]
+            fps = fut.result()
+            status = "ok" if fps is not None else "timeout_or_error"
+            new_cache[abs_path] = (row.size_bytes, row.mtime_ns, fps, status)
+            if fps is None:
+                modified_time = _local_dt(row.mtime_ns)
+                log(
+                    f"[ffprobe_fail] {row.path} (ext={row.ext}, "
+                    f"size={row.size_bytes}, mtime={modified_time})"
+                )
+            probed += 1
+            if progress_every and (probed % progress_every == 0):
+                print(f"[progress] probed={probed:,}")
+            yield row._replace(fps=fps, ffprobe_status=status)
 
     try:
-        for p in dir_path.rglob("*"):
-            scanned += 1
-            if progress_every and (scanned % progress_every == 0):
-                print(f"[progress] scanned={scanned:,} matched={matched:,} last={p}")
-
-            if not p.is_file():
-                continue
-
-            ext = p.suffix.lower()
-            if ext not in norm_exts:
-                continue
-
-            matched += 1
-
-            # Fast metadata
-            st = p.stat()
-            modified_time = datetime.fromtimestamp(st.st_mtime)
-            size_bytes = st.st_size
-
-            fps = None
-            ffprobe_status = "skip"
-
-            # Only run ffprobe on video-like extensions
-            if ext in video_exts:
-                fps = get_fps_ffprobe(p, timeout_s=ffprobe_timeout_s)
-                ffprobe_status = "ok" if fps is not None else "timeout_or_error"
-                if ffprobe_status != "ok":
-                    log(
-                        f"[ffprobe_fail] {p} (ext={ext}, size={size_bytes}, mtime={modified_time})"
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for e in _walk(str(dir_path), excluded):
+                scanned += 1
+                if progress_every and (scanned % progress_every == 0):
+                    print(
+                        f"[progress] scanned={scanned:,} matched={matched:,} last={e.path}"
                     )
 
-            rows.append(
-                {
-                    "path": str(p),
-                    "name": p.name,
-                    "ext": ext,
-                    "modified_time": modified_time,
-                    "size_bytes": size_bytes,
-                    "fps": fps,
-                    "ffprobe_status": ffprobe_status,
-                }
-            )
+                # Filter on the name first: is_file() is free when the
+                # filesystem reports d_type, but costs a stat() when it doesn't
+                ext = os.path.splitext(e.name)[1].lower()
+                if ext not in norm_exts or not e.is_file():
+                    continue
+
+                matched += 1
+
+                # Single stat per match; DirEntry caches it, so mtime and size
+                # come from the same call and no Path object is built here
+                st = e.stat()
+                row = ScanRow(
+                    e.path, e.name, ext, st.st_mtime_ns, st.st_size, None, "skip"
+                )
+
+                if ext not in video_exts:
+                    yield row
+                    continue
+
+                # Videos: reuse a successful cached probe when size+mtime are
+                # unchanged; anything else (incl. past timeouts, which may
+                # have been a slow mount) is queued for ffprobe again
+                abs_path = os.path.abspath(e.path)
+                hit = cache.get(abs_path)
+                if (
+                    hit
+                    and hit[3] == "ok"
+                    and hit[0] == st.st_size
+                    and hit[1] == st.st_mtime_ns
+                ):
+                    new_cache[abs_path] = hit
+                    yield row._replace(fps=hit[2], ffprobe_status=hit[3])
+                    continue
+
+                pending.append((row, abs_path))
+                if len(pending) >= batch_size:
+                    yield from flush(ex)
+
+            if pending:
+                yield from flush(ex)
 
     finally:
         if log_f:
             log_f.close()
 
-    df = pd.DataFrame(rows)
+    if cache_path:
+        save_probe_cache(cache_path, new_cache)
+
+
+def scan_files(
+    dir_path: str | Path,
+    exts: Sequence[str],
+    ffprobe_timeout_s: int = 5,
+    progress_every: int = 0,
+    log_path: Optional[str | Path] = None,
+    video_exts: Optional[set[str]] = None,
+    ffprobe_workers: Optional[int] = None,
+    cache_path: Optional[str | Path] = None,
+    exclude: Optional[Sequence[str | Path]] = None,
+) -> pd.DataFrame:
+    """
+    Scan directory recursively and return DataFrame with:
+    - path (full path)
+    - name
+    - ext
+    - modified_time (mtime)   # used as "shoot time" proxy if file untouched
+    - size_bytes
+    - fps (videos only; None otherwise or on failure/timeout)
+    - ffprobe_status ("ok" | "skip" | "timeout_or_error")
+
+    ffprobe runs on a thread pool of `ffprobe_workers` threads
+    (default: min(16, 2 * cpu_count)).
+
+    If `cache_path` is given, fps results are kept in that parquet sidecar
+    keyed by absolute path; videos whose size and mtime_ns are unchanged
+    since the last scan reuse the cached result instead of re-running ffprobe.
+    Only successful probes are reused; failures are probed (and logged) again.
+
+    Directories listed in `exclude` are skipped along with their subtrees.
+    For trees too large to hold in memory, use iter_scan_files directly.
+    """
+    return _rows_to_frame(
+        iter_scan_files(
+            dir_path,
+            exts,
+            ffprobe_timeout_s=ffprobe_timeout_s,
+            progress_every=progress_every,
+            log_path=log_path,
+            video_exts=video_exts,
+            ffprobe_workers=ffprobe_workers,
+            cache_path=cache_path,
+            exclude=exclude,
+        )
+    )
+
+
+def _rows_to_frame(rows: Iterable[ScanRow]) -> pd.DataFrame:
+    """Build the sorted scan DataFrame (scan_files' output) from ScanRows."""
+    # Column-wise accumulation: one typed array/list per output column, so
+    # the DataFrame is built once with no per-row dict or dtype inference.
+    paths: list[str] = []
+    names: list[str] = []
+    ext_col: list[str] = []
+    mtimes_ns = array("q")
+    sizes = array("q")
+    fpss = array("d")
+    statuses: list[str] = []
+
+    for row in rows:
+        paths.append(row.path)
+        names.append(row.name)
+        ext_col.append(row.ext)
+        mtimes_ns.append(row.mtime_ns)
+        sizes.append(row.size_bytes)
+        fpss.append(NAN if row.fps is None else row.fps)
+        statuses.append(row.ffprobe_status)
+
+    # mtime -> local naive datetime, exactly as _local_dt: round to
+    # microseconds, then shift by the UTC offset in force at that second.
+    # time.localtime knows historical offsets, as datetime.fromtimestamp does;
+    # a tz_convert(tzlocal()) would apply today's offset to every timestamp.
+    us = (np.frombuffer(mtimes_ns, dtype=np.int64) + 500) // 1000
+    gmtoff = np.fromiter(
+        (time.localtime(s).tm_gmtoff for s in (us // 1_000_000).tolist()),
+        dtype=np.int64,
+        count=len(us),
+    )
+    modified_time = pd.to_datetime(us + gmtoff * 1_000_000, unit="us")
+
+    df = pd.DataFrame(
+        {
+            "path": paths,
+            "name": names,
+            "ext": ext_col,
+            "modified_time": modified_time,
+            "size_bytes": np.frombuffer(sizes, dtype=np.int64),
+            "fps": np.frombuffer(fpss, dtype=np.float64),
+            "ffprobe_status": statuses,
+        }
+    )
 
     # Optional: stable sort so diffs are nicer
     if not df.empty:
@@ -181,6 +441,198 @@ def scan_files(
     return df
 
 
+def _write_csv_atomic(df: pd.DataFrame, out: str | Path) -> None:
+    out = Path(out)
+    tmp = out.with_name(out.name + ".tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, out)
+
+
+def _stat_row(
+    path: str,
+    norm_exts: frozenset[str],
+    video_exts: set[str],
+    ffprobe_timeout_s: int,
+    prev: Optional[ScanRow],
+) -> Optional[ScanRow]:
+    """
+    ScanRow for a single path (None if it's gone, not a regular file, or
+    not a wanted extension). ffprobe is skipped when size+mtime match `prev`.
+    """
+    name = os.path.basename(path)
+    ext = os.path.splitext(name)[1].lower()
+    if ext not in norm_exts:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    row = ScanRow(path, name, ext, st.st_mtime_ns, st.st_size, None, "skip")
+    if ext not in video_exts:
+        return row
+    if prev and prev.size_bytes == st.st_size and prev.mtime_ns == st.st_mtime_ns:
+        return prev
+
+    fps = get_fps_ffprobe(path, ffprobe_timeout_s)
+    return row._replace(
+        fps=fps, ffprobe_status="ok" if fps is not None else "timeout_or_error"
+    )
+
+
+def watch_scan(
+    dir_path: str | Path,
+    exts: Sequence[str],
+    out: str | Path,
+    ffprobe_timeout_s: int = 5,
+    video_exts: Optional[set[str]] = None,
+    cache_path: Optional[str | Path] = None,
+    exclude: Optional[Sequence[str | Path]] = None,
+    settle_s: float = 2.0,
+    flush_every_s: float = 5.0,
+    **scan_kwargs,
+) -> None:
+    """
+    Seed `out` from a full scan, then keep it current from filesystem events.
+
+    Events from the watchdog observer thread are queued as (path, event_type);
+    this loop coalesces them, waits until a path has been quiet for `settle_s`
+    (so files still being copied aren't probed half-written), re-stats and
+    re-probes only those paths, and rewrites the CSV atomically at most every
+    `flush_every_s` seconds. Runs until interrupted (Ctrl-C).
+
+    Without the optional `watchdog` package this degrades to a single scan.
+    """
+    root = str(Path(dir_path))
+    video_exts = video_exts or set(VIDEO_EXTS_DEFAULT)
+    norm_exts = _norm_exts(exts)
+    excluded = frozenset(os.path.abspath(p) for p in (exclude or ()))
+
+    def scan(d: str, cache: Optional[str | Path] = None) -> Iterator[ScanRow]:
+        return iter_scan_files(
+            d,
+            exts,
+            ffprobe_timeout_s=ffprobe_timeout_s,
+            video_exts=video_exts,
+            cache_path=cache,
+            exclude=exclude,
+            **scan_kwargs,
+        )
+
+    # Only the seed scan touches the sidecar cache: iter_scan_files rewrites
+    # it with just the entries it saw, so subtree rescans must not.
+    rows: Dict[str, ScanRow] = {row.path: row for row in scan(root, cache_path)}
+    _write_csv_atomic(_rows_to_frame(rows.values()), out)
+    print(f"Saved {len(rows)} records to {out}")
+
+    if FileSystemEventHandler is None:
+        print("[watch] watchdog is not installed (pip install watchdog); not watching.")
+        return
+
+    events: queue.Queue[Tuple[str, str]] = queue.Queue()
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event: FileSystemEvent) -> None:
+            if event.event_type in ("opened", "closed_no_write"):
+                return
+            kind = "dir" if event.is_directory else "file"
+            if event.event_type == "moved":
+                events.put((os.fsdecode(event.src_path), f"{kind}_deleted"))
+                events.put((os.fsdecode(event.dest_path), f"{kind}_created"))
+            elif event.event_type in ("created", "deleted"):
+                events.put((os.fsdecode(event.src_path), f"{kind}_{event.event_type}"))
+            else:  # modified / closed
+                events.put((os.fsdecode(event.src_path), f"{kind}_changed"))
+
+    def is_excluded(path: str) -> bool:
+        if not excluded:
+            return False
+        d = os.path.dirname(os.path.abspath(path))
+        while True:
+            if d in excluded:
+                return True
+            parent = os.path.dirname(d)
+            if parent == d:
+                return False
+            d = parent
+
+    observer = Observer()
+    observer.schedule(_Handler(), root, recursive=True)
+    observer.start()
+    print(f"[watch] watching {root} (Ctrl-C to stop)")
+
+    pending: Dict[str, Tuple[str, float]] = {}  # path -> (last event, seen at)
+    dirty = False
+    last_flush = time.monotonic()
+    try:
+        while True:
+            # Block briefly for the next event, then drain whatever is queued
+            try:
+                item = events.get(timeout=0.5)
+                while True:
+                    path, kind = item
+                    if not is_excluded(path):
+                        pending[path] = (kind, time.monotonic())
+                    item = events.get_nowait()
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for path, (kind, seen) in list(pending.items()):
+                if now - seen < settle_s:
+                    continue
+                del pending[path]
+
+                if kind == "dir_deleted":
+                    prefix = path + os.sep
+                    for p in [p for p in rows if p.startswith(prefix)]:
+                        del rows[p]
+                        dirty = True
+                elif kind == "dir_created":
+                    for row in scan(path):
+                        rows[row.path] = row
+                        dirty = True
+                elif kind != "dir_changed":
+                    row = _stat_row(
+                        path, norm_exts, video_exts, ffprobe_timeout_s, rows.get(path)
+                    )
+                    if row is None:
+                        dirty |= rows.pop(path, None) is not None
+                    elif rows.get(path) != row:
+                        rows[path] = row
+                        dirty = True
+                        print(f"[watch] {row.ffprobe_status:>16}  {path}")
+
+            if dirty and now - last_flush >= flush_every_s:
+                _write_csv_atomic(_rows_to_frame(rows.values()), out)
+                dirty = False
+                last_flush = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        if dirty:
+            _write_csv_atomic(_rows_to_frame(rows.values()), out)
+        if cache_path:
+            save_probe_cache(
+                Path(cache_path),
+                {
+                    os.path.abspath(r.path): (
+                        r.size_bytes,
+                        r.mtime_ns,
+                        r.fps,
+                        r.ffprobe_status,
+                    )
+                    for r in rows.values()
+                    if r.ext in video_exts
+                },
+            )
+        print(f"[watch] stopped; {len(rows)} records in {out}")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Scan directory for file modified timestamps + video FPS (safe: no hangs)."
@@ -199,6 +651,12 @@ def main():
         default=5,
         help="Seconds before ffprobe is killed (prevents hangs). Default: 5",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Concurrent ffprobe processes (0 = min(16, 2 * cpu_count)).",
+    )
     parser.add_argument(
         "--progress-every",
         type=int,
@@ -210,16 +668,59 @@ def main():
         default="",
         help="Optional log file for ffprobe failures/timeouts.",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore the <out>.cache.parquet sidecar and re-run ffprobe on every video.",
+    )
+
+    parser.add_argument(
+        "--exclude",
+        nargs="*",
+        default=[],
+        help="Directories to skip entirely (their subtrees are never listed).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write CSV rows as they are scanned (constant memory, unsorted).",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the initial scan, keep --out updated as files change "
+        "(requires the optional watchdog package).",
+    )
 
     args = parser.parse_args()
 
-    df = scan_files(
-        args.dir,
-        args.ext,
+    scan_kwargs = dict(
         ffprobe_timeout_s=args.ffprobe_timeout,
         progress_every=args.progress_every,
         log_path=args.log or None,
+        ffprobe_workers=args.workers or None,
+        cache_path=(
+            None if args.no_cache else Path(args.out).with_suffix(".cache.parquet")
+        ),
+        exclude=args.exclude,
     )
+
+    if args.watch:
+        watch_scan(args.dir, args.ext, args.out, **scan_kwargs)
+        return
+
+    if args.stream:
+        n = 0
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=COLUMNS, lineterminator="\n")
+            w.writeheader()
+            for row in iter_scan_files(args.dir, args.ext, **scan_kwargs):
+                w.writerow(row.to_record())
+                n += 1
+        print(f"Saved {n} records to {args.out}")
+        return
+
+    df = scan_files(args.dir, args.ext, **scan_kwargs)
     df.to_csv(args.out, index=False)
     print(f"Saved {len(df)} records to {args.out}")
 
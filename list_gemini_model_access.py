@@ -8,14 +8,15 @@ client = genai.Client()
 print("Check available models for my api key...")
 print("-" * 50)
 
-# list all models
-for model in client.models.list():
+# list all models (fetched once, reused for the Gemini 3 check below)
+models = list(client.models.list())
+for model in models:
     print(f"ID: {model.name}")
     print(f"Supported Action: {model.supported_actions}")
     print("-" * 50)
 
 # Check for Gemini 3 specifically
-has_g3 = any("gemini-3-flash" in m.name for m in client.models.list())
+has_g3 = any("gemini-3-flash" in m.name for m in models)
 if has_g3:
     print("Success: have access to gemini 3 flash")
 else:
@@ -4,7 +4,7 @@ analyze_videos_with_gemini.py
 Workflow:
 - shrink original videos -> TEMP_DIR
 - upload shrunk videos to Gemini Flash
-- analyze with response_schema (Pydantic)
+- analyze with a JSON response schema (precomputed from the Pydantic model)
 - write incremental results to LOG_FILE (resume-safe)
 
 Design change:
@@ -14,20 +14,25 @@ Design change:
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
 import time
 from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Optional, List, Literal, Dict, Any, Sequence
+from typing import Optional, List, Literal, Dict, Any, Sequence, Tuple
 
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
 from google import genai
 
 # from project
 from video_analysis.video_utils import (
+    append_record,
+    journal_path,
     shrink_video,
-    wait_until_ready,
+    upload_or_reuse_async,
     load_existing_results,
     write_results,
 )
@@ -60,6 +65,23 @@ class VideoAnalysis(BaseModel):
     )
 
 
+# Built once at import rather than per request: the JSON schema is passed to
+# Gemini as a plain dict (response_json_schema), so the SDK doesn't reflect
+# over the model on every call, and replies go through a prebuilt validator.
+_SCHEMA: Dict[str, Any] = VideoAnalysis.model_json_schema()
+_VALIDATOR: TypeAdapter[VideoAnalysis] = TypeAdapter(VideoAnalysis)
+
+
+class Batch(BaseModel):
+    """Reply for a multi-video request: one analysis per video, in order."""
+
+    results: List[VideoAnalysis]
+
+
+_BATCH_SCHEMA: Dict[str, Any] = Batch.model_json_schema()
+_BATCH_VALIDATOR: TypeAdapter[Batch] = TypeAdapter(Batch)
+
+
 # --------------------------- Configuration --------------------------------
 
 
@@ -77,6 +99,15 @@ class Config:
     crf: int = 32
     preset: str = "ultrafast"
     audio_bitrate: str = "64k"
+    # encoder threads per ffmpeg; None = cpu_count // shrink_workers
+    ffmpeg_threads_per_invocation: Optional[int] = None
+    hwaccel: bool = True  # try -hwaccel auto decode first (software fallback)
+
+    # server-side context cache for the prompt (falls back to inline); off by
+    # default since PROMPT alone is below Gemini's minimum cacheable size --
+    # enable it once the cached instruction is large enough
+    cache_prompt: bool = False
+    prompt_cache_ttl: str = "3600s"
 
     # robustness
     ffmpeg_timeout_s: int = 60 * 30  # 30 min per file
@@ -84,38 +115,93 @@ class Config:
     processing_max_wait_s: int = 60 * 10  # 10 min max processing wait
     delete_uploaded_files: bool = False  # set True if you want cleanup
 
+    # concurrency (one asyncio event loop): videos in Gemini upload/generate
+    # at once; the work is remote-latency bound, so no thread per video
+    max_workers: int = min(8, os.cpu_count() or 4)
+    # ffmpeg shrinks run in worker threads, overlapping the Gemini calls;
+    # at most shrink_queue_size shrunk files wait for a free analyzer slot
+    shrink_workers: int = 2
+    shrink_queue_size: int = 2
+    # videos sent together in one generate_content call (one round-trip,
+    # a list-of-analyses reply); 1 = one request per video
+    videos_per_request: int = 1
+
+
+PROMPT = (
+    "You are helping write a kitten adoption gallery caption.\n"
+    "Describe the video content in a warm, natural tone.\n"
+    "Be concrete about what is visible; do not guess.\n"
+    "If you can, note distinct kitten markings (paw colors, coats, stripes), setting, and mood.\n"
+)
+
+
+def create_prompt_cache(cfg: Config, client: genai.Client) -> Optional[str]:
+    """
+    Put PROMPT in a server-side context cache so calls reference it by name
+    instead of resending it. Returns the cache name, or None when caching is
+    off or the cache can't be created (Gemini rejects caches below a
+    model-specific minimum token count) -- callers then send it inline.
+    """
+    if not cfg.cache_prompt:
+        return None
+    try:
+        cache = client.caches.create(
+            model=cfg.model_id,
+            config={"system_instruction": PROMPT, "ttl": cfg.prompt_cache_ttl},
+        )
+    except Exception as e:
+        print(f"ℹ️ Prompt cache unavailable, sending prompt inline: {e}")
+        return None
+    return cache.name
+
 
 def make_temp_name(original: Path) -> str:
     # stable + filesystem-safe
     return f"shrunk__{original.stem}.mp4"
 
 
-def analyze_video(
+async def analyze_video_async(
     cfg: Config,
     client: genai.Client,
     shrunk_path: Path,
     original_path: Path,
+    by_hash: Optional[Dict[str, Any]] = None,
+    cached_prompt: Optional[str] = None,
 ) -> Dict[str, Any]:
+    """
+    Upload (or reuse, see upload_or_reuse_async) the shrunk video and
+    analyze it, using the async client (client.aio) throughout.
+
+    `by_hash` is the store's upload cache; it is ignored when
+    cfg.delete_uploaded_files is set, since those uploads don't outlive
+    the call. `cached_prompt` is the name of a Gemini context cache holding
+    PROMPT as its system instruction (see create_prompt_cache); without it
+    the prompt is sent inline.
+    """
     print(f"🧠 Analyzing: {original_path.name}")
 
-    uploaded = client.files.upload(file=str(shrunk_path))
-    uploaded = wait_until_ready(cfg, client, uploaded)
-
-    prompt = (
-        "You are helping write a kitten adoption gallery caption.\n"
-        "Describe the video content in a warm, natural tone.\n"
-        "Be concrete about what is visible; do not guess.\n"
-        "If you can, note distinct kitten markings (paw colors, coats, stripes), setting, and mood.\n"
+    uploaded = await upload_or_reuse_async(
+        cfg,
+        client,
+        shrunk_path,
+        None if cfg.delete_uploaded_files else by_hash,
     )
 
+    config: Dict[str, Any] = {
+        "response_mime_type": "application/json",
+        "response_json_schema": _SCHEMA,
+    }
+    if cached_prompt:
+        contents = [uploaded]
+        config["cached_content"] = cached_prompt
+    else:
+        contents = [uploaded, PROMPT]
+
     try:
-        resp = client.models.generate_content(
+        resp = await client.aio.models.generate_content(
             model=cfg.model_id,
-            contents=[uploaded, prompt],
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": VideoAnalysis,
-            },
+            contents=contents,
+            config=config,
         )
 
         value = resp.parsed  # do NOT annotate this
@@ -126,31 +212,157 @@ def analyze_video(
         if isinstance(value, VideoAnalysis):
             parsed: VideoAnalysis = value
         elif isinstance(value, dict):
-            parsed = VideoAnalysis.model_validate(value)
+            parsed = _VALIDATOR.validate_python(value)
         elif isinstance(value, BaseModel):
             # Sometimes SDK returns a BaseModel that isn't your class; try to coerce via dict
-            parsed = VideoAnalysis.model_validate(value.model_dump())
+            parsed = _VALIDATOR.validate_python(value.model_dump())
         else:
             raise TypeError(f"Unexpected resp.parsed type: {type(value)}")
 
-        return {
-            "original_filename": original_path.name,
-            "original_path": str(original_path),
-            "shrunk_path": str(shrunk_path),
-            "file_uri": getattr(uploaded, "uri", None),
-            "timestamp": time.ctime(),
-            "model_id": cfg.model_id,
-            "analysis": parsed.model_dump(),
-        }
+        return _analysis_record(cfg, original_path, shrunk_path, uploaded, parsed)
 
     finally:
         if cfg.delete_uploaded_files:
             try:
-                client.files.delete(name=uploaded.name)
+                await client.aio.files.delete(name=uploaded.name)
             except Exception:
                 pass
 
 
+def _analysis_record(
+    cfg: Config,
+    original_path: Path,
+    shrunk_path: Path,
+    uploaded: Any,
+    parsed: VideoAnalysis,
+) -> Dict[str, Any]:
+    return {
+        "original_filename": original_path.name,
+        "original_path": str(original_path),
+        "shrunk_path": str(shrunk_path),
+        "file_uri": getattr(uploaded, "uri", None),
+        "timestamp": time.ctime(),
+        "model_id": cfg.model_id,
+        "analysis": parsed.model_dump(),
+    }
+
+
+async def analyze_videos_batch_async(
+    cfg: Config,
+    client: genai.Client,
+    videos: Sequence[Tuple[Path, Path]],
+    by_hash: Optional[Dict[str, Any]] = None,
+    cached_prompt: Optional[str] = None,
+) -> List[Dict[str, Any] | Exception]:
+    """
+    Analyze several (shrunk_path, original_path) videos in one
+    generate_content call.
+
+    All shrunk files are uploaded (or reused) concurrently and the ones that
+    made it are sent as file parts in order, followed by an instruction to
+    return one entry per video; the reply is a Batch and is split back into
+    per-video records in the same order. Returns one item per input video:
+    its record, or the exception its upload failed with. Raises if the
+    request itself fails or the reply has the wrong number of entries.
+    `by_hash` and `cached_prompt` are as in analyze_video_async.
+    """
+    names = ", ".join(original.name for _, original in videos)
+    print(f"🧠 Analyzing {len(videos)} videos in one request: {names}")
+
+    outcomes = await asyncio.gather(
+        *(
+            upload_or_reuse_async(
+                cfg,
+                client,
+                shrunk_path,
+                None if cfg.delete_uploaded_files else by_hash,
+            )
+            for shrunk_path, _ in videos
+        ),
+        return_exceptions=True,
+    )
+    for u in outcomes:
+        if isinstance(u, BaseException) and not isinstance(u, Exception):
+            raise u
+    sent = [
+        (video, u) for video, u in zip(videos, outcomes) if not isinstance(u, Exception)
+    ]
+    uploads = [u for _, u in sent]
+    if not sent:
+        return list(outcomes)
+
+    try:
+        config: Dict[str, Any] = {
+            "response_mime_type": "application/json",
+            "response_json_schema": _BATCH_SCHEMA,
+        }
+        instruction = (
+            f"Analyze the following {len(sent)} videos in order and return "
+            "one entry per video in `results`, in the same order."
+        )
+        contents: List[Any] = list(uploads)
+        if cached_prompt:
+            config["cached_content"] = cached_prompt
+            contents.append(instruction)
+        else:
+            contents.append(PROMPT + "\n" + instruction)
+
+        resp = await client.aio.models.generate_content(
+            model=cfg.model_id,
+            contents=contents,
+            config=config,
+        )
+
+        value = resp.parsed
+        if value is None:
+            raise ValueError("Gemini returned no parsed content (resp.parsed is None).")
+        if isinstance(value, BaseModel):
+            value = value.model_dump()
+        batch = _BATCH_VALIDATOR.validate_python(value)
+
+        if len(batch.results) != len(sent):
+            raise ValueError(
+                f"Gemini returned {len(batch.results)} analyses "
+                f"for {len(sent)} videos."
+            )
+
+        parsed_iter = iter(batch.results)
+        return [
+            (
+                u
+                if isinstance(u, Exception)
+                else _analysis_record(
+                    cfg, original_path, shrunk_path, u, next(parsed_iter)
+                )
+            )
+            for (shrunk_path, original_path), u in zip(videos, outcomes)
+        ]
+
+    finally:
+        if cfg.delete_uploaded_files:
+            for uploaded in uploads:
+                try:
+                    await client.aio.files.delete(name=uploaded.name)
+                except Exception:
+                    pass
+
+
+def analyze_video(
+    cfg: Config,
+    client: genai.Client,
+    shrunk_path: Path,
+    original_path: Path,
+    by_hash: Optional[Dict[str, Any]] = None,
+    cached_prompt: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Blocking wrapper around analyze_video_async (not for use inside a running loop)."""
+    return asyncio.run(
+        analyze_video_async(
+            cfg, client, shrunk_path, original_path, by_hash, cached_prompt
+        )
+    )
+
+
 def _normalize_paths(video_paths: Sequence[str | Path]) -> List[Path]:
     out: List[Path] = []
     for p in video_paths:
@@ -164,12 +376,236 @@ def asset_key_from_path(p: Path) -> str:
     return Path(p.name).stem
 
 
+def _error_record(
+    cfg: Config,
+    asset_key: str,
+    original_path: Path,
+    shrunk_path: Path,
+    e: Exception,
+) -> Dict[str, Any]:
+    print(f"❌ Error processing {original_path.name}: {e}\n")
+    return {
+        "asset_key": asset_key,
+        "original_filename": original_path.name,
+        "original_path": str(original_path),
+        "shrunk_path": str(shrunk_path),
+        "timestamp": time.ctime(),
+        "model_id": cfg.model_id,
+        "error": str(e),
+    }
+
+
+def _shrink_meta(cfg: Config, original_path: Path) -> Dict[str, Any]:
+    """
+    What a shrunk file was made from: source size + mtime_ns and a stable
+    digest of the settings that change ffmpeg's output.
+    """
+    st = original_path.stat()
+    params = (cfg.shrink_width, cfg.shrink_fps, cfg.crf, cfg.preset, cfg.audio_bitrate)
+    return {
+        "src_size": st.st_size,
+        "src_mtime_ns": st.st_mtime_ns,
+        "cfg_hash": hashlib.sha256(repr(params).encode()).hexdigest()[:16],
+    }
+
+
+def _shrink_if_stale(cfg: Config, original_path: Path, shrunk_path: Path) -> None:
+    """
+    Shrink unless an up-to-date shrunk file already exists (blocking).
+
+    Freshness comes from the <shrunk>.meta.json sidecar written after each
+    successful shrink: reuse only if the source size/mtime and the shrink
+    settings all match. Shrunk files from before the sidecar existed fall
+    back to the old "newer than the source" check.
+    """
+    meta_path = shrunk_path.with_suffix(".meta.json")
+    meta = _shrink_meta(cfg, original_path)
+
+    if shrunk_path.exists():
+        try:
+            fresh = orjson.loads(meta_path.read_bytes()) == meta
+        except FileNotFoundError:
+            fresh = shrunk_path.stat().st_mtime >= original_path.stat().st_mtime
+        except orjson.JSONDecodeError:
+            fresh = False
+        if fresh:
+            print(f"📦 Using existing shrunk file: {shrunk_path.name}")
+            return
+
+    # drop the old sidecar first so an interrupted shrink is never "fresh"
+    meta_path.unlink(missing_ok=True)
+    shrink_video(cfg, original_path, shrunk_path)
+    meta_path.write_bytes(orjson.dumps(meta))
+
+
+async def _process_group_async(
+    cfg: Config,
+    client: genai.Client,
+    group: Sequence[Tuple[str, Path]],
+    by_hash: Dict[str, Any],
+    cached_prompt: Optional[str],
+    shrink_sem: asyncio.Semaphore,
+    ahead_sem: asyncio.Semaphore,
+    analyze_sem: asyncio.Semaphore,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Shrink (in worker threads) then analyze a group of videos sent to
+    Gemini in one request (cfg.videos_per_request; usually a single video).
+
+    shrink_sem bounds concurrent ffmpeg runs and analyze_sem concurrent
+    Gemini calls. ahead_sem is held from the start of the group's shrinks
+    until an analyze slot is free, so shrinking runs at most a few groups
+    ahead of the Gemini calls.
+
+    Never raises on a bad video: failures come back as error records so
+    the caller can log them like any other result. A video that fails to
+    shrink is left out of the request; a failed request fails the videos
+    it carried.
+    """
+    jobs = [
+        (asset_key, original_path, cfg.temp_dir / make_temp_name(original_path))
+        for asset_key, original_path in group
+    ]
+    results: List[Tuple[str, Dict[str, Any]]] = []
+
+    async def shrink(original_path: Path, shrunk_path: Path) -> None:
+        async with shrink_sem:
+            await asyncio.to_thread(_shrink_if_stale, cfg, original_path, shrunk_path)
+
+    await ahead_sem.acquire()
+    waiting = True
+    try:
+        outcomes = await asyncio.gather(
+            *(
+                shrink(original_path, shrunk_path)
+                for _, original_path, shrunk_path in jobs
+            ),
+            return_exceptions=True,
+        )
+        ready = []
+        for job, outcome in zip(jobs, outcomes):
+            if isinstance(outcome, Exception):
+                results.append((job[0], _error_record(cfg, *job, outcome)))
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                ready.append(job)
+
+        if ready:
+            try:
+                async with analyze_sem:
+                    ahead_sem.release()
+                    waiting = False
+
+                    if len(ready) == 1:
+                        _, original_path, shrunk_path = ready[0]
+                        records: List[Dict[str, Any] | Exception] = [
+                            await analyze_video_async(
+                                cfg,
+                                client,
+                                shrunk_path,
+                                original_path,
+                                by_hash,
+                                cached_prompt,
+                            )
+                        ]
+                    else:
+                        records = await analyze_videos_batch_async(
+                            cfg,
+                            client,
+                            [
+                                (shrunk_path, original_path)
+                                for _, original_path, shrunk_path in ready
+                            ],
+                            by_hash,
+                            cached_prompt,
+                        )
+            except Exception as e:
+                for job in ready:
+                    results.append((job[0], _error_record(cfg, *job, e)))
+            else:
+                for job, record in zip(ready, records):
+                    if isinstance(record, Exception):
+                        results.append((job[0], _error_record(cfg, *job, record)))
+                        continue
+                    # ✅ stamp asset_key so downstream merge is trivial
+                    record["asset_key"] = job[0]
+                    results.append((job[0], record))
+                    print(f"✅ Finished {job[1].name}\n")
+    finally:
+        if waiting:
+            ahead_sem.release()
+
+    return results
+
+
+async def _run_todo_async(
+    cfg: Config,
+    client: genai.Client,
+    todo: Dict[str, Path],
+    store: Dict[str, Any],
+    save_every: int,
+    cached_prompt: Optional[str],
+) -> None:
+    """Process `todo` concurrently; persist each result as it completes."""
+    by_asset_key: Dict[str, Any] = store["by_asset_key"]
+    # sha256 of shrunk file -> Gemini upload, reused while still ACTIVE there
+    by_hash: Dict[str, Any] = store.setdefault("by_hash", {})
+    journal = journal_path(cfg.log_file)
+
+    shrink_sem = asyncio.Semaphore(max(1, cfg.shrink_workers))
+    ahead_sem = asyncio.Semaphore(
+        max(1, cfg.shrink_workers) + max(0, cfg.shrink_queue_size)
+    )
+    analyze_sem = asyncio.Semaphore(max(1, cfg.max_workers))
+
+    items = list(todo.items())
+    k = max(1, cfg.videos_per_request)
+    tasks = [
+        asyncio.create_task(
+            _process_group_async(
+                cfg,
+                client,
+                items[i : i + k],
+                by_hash,
+                cached_prompt,
+                shrink_sem,
+                ahead_sem,
+                analyze_sem,
+            )
+        )
+        for i in range(0, len(items), k)
+    ]
+
+    processed_since_save = 0
+    try:
+        # Results are stored and persisted here as they complete; everything
+        # runs on one event loop, so by_asset_key / by_hash / write_results
+        # never race with each other.
+        for fut in asyncio.as_completed(tasks):
+            for asset_key, record in await fut:
+                # ✅ store by key (journal first: O(1) and crash-safe)
+                by_asset_key[asset_key] = record
+                append_record(journal, asset_key, record)
+                processed_since_save += 1
+
+            if processed_since_save >= save_every:
+                write_results(cfg.log_file, store)
+                processed_since_save = 0
+    finally:
+        for t in tasks:
+            t.cancel()
+
+    if processed_since_save:
+        write_results(cfg.log_file, store)
+
+
 def analyze_videos_with_gemini_pipeline(
     video_paths: Sequence[str | Path],
     cfg: Optional[Config] = None,
     *,
     client: Optional[genai.Client] = None,
-    save_every: int = 1,
+    save_every: int = 10,
 ) -> Dict[str, Any]:
     """
     Analyze a set of videos using Gemini and persist results keyed by asset_key.
@@ -177,11 +613,15 @@ def analyze_videos_with_gemini_pipeline(
     This pipeline:
     - Accepts an explicit list of local video paths
     - Shrinks videos to temporary files as needed
-    - Runs Gemini-based video analysis
+    - Runs Gemini-based video analysis, up to `cfg.max_workers` requests at
+      once, while the next videos are being shrunk (two-stage pipeline on one
+      asyncio event loop; ffmpeg runs in worker threads). Each request carries
+      `cfg.videos_per_request` videos (default 1).
     - Stores results in a dictionary keyed by `asset_key`
       (derived from the original filename stem)
     - Supports resuming from an existing log file without reprocessing
-    - Writes results incrementally to disk for safety
+    - Writes results incrementally to disk for safety (per-record journal
+      plus a periodic atomic snapshot)
 
     Args:
         video_paths:
@@ -192,8 +632,11 @@ def analyze_videos_with_gemini_pipeline(
         client:
             Optional injected genai.Client. If not provided, a new client is created.
         save_every:
-            Persist results to disk after processing every N videos.
-            Default is 1 (safest).
+            Rewrite the full JSON snapshot after every N videos. Each result
+            is also appended to an NDJSON journal next to the log file as soon
+            as it arrives, so nothing is lost in between; the journal is
+            replayed on the next run and cleared by each snapshot.
+            Default is 10.
 
     Returns:
         A dictionary of the form:
@@ -214,6 +657,8 @@ def analyze_videos_with_gemini_pipeline(
           primary join key for downstream merging (e.g., into kittens.json).
         - Results are deduplicated by asset_key, not by full file path.
         - This function is deterministic and safe to re-run.
+        - Blocking: runs its own event loop (asyncio.run), so call it from
+          synchronous code, not from inside a running loop.
     """
     load_dotenv()
 
@@ -235,81 +680,53 @@ def analyze_videos_with_gemini_pipeline(
     by_asset_key: Dict[str, Any] = store.setdefault("by_asset_key", {})
 
     # dedupe by asset_key (NOT original_path)
-    already_done = {
+    already_done = frozenset(
         k
         for k, r in by_asset_key.items()
         if isinstance(r, dict) and (r.get("analysis") or r.get("error"))
-    }
+    )
 
     paths = _normalize_paths(video_paths)
     if not paths:
         print("⚠️ No video paths provided.")
         return store
 
-    missing = [p for p in paths if not p.exists()]
+    # Drop already-logged videos up front, before any per-file stat. One job
+    # per asset_key (the last path wins, as it would sequentially); two paths
+    # with the same stem would also share a temp file.
+    pending = [
+        (asset_key, p)
+        for asset_key, p in ((asset_key_from_path(p), p) for p in paths)
+        if asset_key not in already_done
+    ]
+    todo: Dict[str, Path] = dict(pending)
+    skipped = len(paths) - len(pending)
+
+    missing = [p for p in todo.values() if not p.exists()]
     if missing:
         raise FileNotFoundError(
             "Some input videos do not exist:\n" + "\n".join(str(p) for p in missing)
         )
 
-    print(f"Will process {len(paths)} video(s)")
+    if skipped:
+        print(f"↩️ Skipping {skipped} already-logged video(s)")
+    print(f"Will process {len(todo)} video(s)")
     print(f"Temp dir: {cfg.temp_dir}")
     print(f"Log file: {cfg.log_file}")
     print(f"Model: {cfg.model_id}\n")
 
-    processed_since_save = 0
-
-    for original_path in paths:
-        asset_key = asset_key_from_path(Path(original_path))
+    cached_prompt = create_prompt_cache(cfg, client) if todo else None
 
-        if asset_key in already_done:
-            print(
-                f"↩️ Skipping already-logged: {original_path.name} (asset_key={asset_key})"
+    try:
+        if todo:
+            asyncio.run(
+                _run_todo_async(cfg, client, todo, store, save_every, cached_prompt)
             )
-            continue
-
-        shrunk_path = cfg.temp_dir / make_temp_name(original_path)
-
-        try:
-            if (
-                shrunk_path.exists()
-                and shrunk_path.stat().st_mtime >= original_path.stat().st_mtime
-            ):
-                print(f"📦 Using existing shrunk file: {shrunk_path.name}")
-            else:
-                shrink_video(cfg, original_path, shrunk_path)
-
-            record = analyze_video(cfg, client, shrunk_path, original_path)
-
-            # ✅ stamp asset_key so downstream merge is trivial
-            if isinstance(record, dict):
-                record["asset_key"] = asset_key
-
-            # ✅ store by key
-            by_asset_key[asset_key] = record
-            processed_since_save += 1
-
-            if processed_since_save >= save_every:
-                write_results(cfg.log_file, store)
-                processed_since_save = 0
-
-            print(f"✅ Finished {original_path.name}\n")
-
-        except Exception as e:
-            err_record = {
-                "asset_key": asset_key,
-                "original_filename": original_path.name,
-                "original_path": str(original_path),
-                "shrunk_path": str(shrunk_path),
-                "timestamp": time.ctime(),
-                "model_id": cfg.model_id,
-                "error": str(e),
-            }
-            by_asset_key[asset_key] = err_record
-            write_results(cfg.log_file, store)
-            print(f"❌ Error processing {original_path.name}: {e}\n")
-
-    if processed_since_save:
-        write_results(cfg.log_file, store)
+    finally:
+        if cached_prompt:
+            try:
+                client.caches.delete(name=cached_prompt)
+            except Exception:
+                pass
 
     return store
@@ -0,0 +1,29 @@
+"""
+video_analysis/json_io.py
+
+Dependency-light JSON file reading (orjson only), shared by video_utils and
+merge_content_with_analysis so the merge doesn't import the Gemini SDK.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+from pathlib import Path
+from typing import Any
+
+import orjson
+
+
+def read_json(path: str | Path) -> Any:
+    """
+    Parse a JSON file straight from a read-only mmap (no bytes copy; pages
+    are faulted in as orjson walks them). Empty files can't be mapped, so
+    they are read normally and fail with the usual decode error.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return orjson.loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as buf:
+                return orjson.loads(buf)
@@ -3,44 +3,154 @@ video_analysis/video_utils.py
 
 Small, reusable helpers for the video description pipeline:
 - ffmpeg execution + shrinking
-- incremental JSON persistence (resume-safe)
-- Gemini upload polling until ready
+- incremental JSON persistence (resume-safe): a JSON snapshot plus an
+  append-only NDJSON journal of records written since that snapshot
+- Gemini upload polling until ready (sync and asyncio)
+- Gemini upload reuse keyed by content hash (asyncio, via client.aio)
 """
 
 from __future__ import annotations
 
-import json
+import asyncio
+import hashlib
+import os
+import random
 import subprocess
+import threading
 import time
+from collections import deque
 from pathlib import Path
-from typing import Any, Dict, List
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
+import httpx
+import orjson
 from google import genai
+from google.genai import errors as genai_errors
 
+from video_analysis.json_io import read_json
+
+try:  # optional: the SDK sends client.aio requests through aiohttp when present
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # ----------------------------- ffmpeg helpers -----------------------------
 
 
+STDERR_TAIL_LINES = 20
+
+
 def run_ffmpeg(cmd: List[str], timeout_s: int) -> None:
-    """Run ffmpeg and raise a clear error if it fails."""
-    try:
-        subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=timeout_s,
+    """
+    Run ffmpeg and raise a clear error if it fails.
+
+    stderr is streamed through a ring buffer that keeps only the last
+    STDERR_TAIL_LINES lines, so a long encode's progress output is never
+    held in memory. The timeout is enforced by a timer that kills ffmpeg.
+    """
+    tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+    timed_out = threading.Event()
+
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+    ) as proc:
+
+        def _kill() -> None:
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout_s, _kill)
+        timer.start()
+        try:
+            assert proc.stderr is not None
+            for line in proc.stderr:
+                line = line.rstrip()
+                if line:
+                    tail.append(line)
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            timer.cancel()
+
+    if timed_out.is_set():
+        raise RuntimeError(f"ffmpeg timed out after {timeout_s}s") from (
+            subprocess.TimeoutExpired(cmd, timeout_s)
         )
-    except subprocess.TimeoutExpired as e:
-        raise RuntimeError(f"ffmpeg timed out after {timeout_s}s") from e
-    except subprocess.CalledProcessError as e:
+    if returncode:
         # Include a bit of stderr to make debugging possible.
-        stderr = (e.stderr or "").strip()
-        tail = "\n".join(stderr.splitlines()[-20:]) if stderr else ""
-        msg = f"ffmpeg failed with exit code {e.returncode}"
-        if tail:
-            msg += f"\nffmpeg stderr (tail):\n{tail}"
-        raise RuntimeError(msg) from e
+        stderr = "\n".join(tail)
+        msg = f"ffmpeg failed with exit code {returncode}"
+        if stderr:
+            msg += f"\nffmpeg stderr (tail):\n{stderr}"
+        raise RuntimeError(msg) from subprocess.CalledProcessError(
+            returncode, cmd, stderr=stderr
+        )
+
+
+def ffmpeg_threads(cfg: Any) -> int:
+    """
+    Threads per ffmpeg invocation: cfg.ffmpeg_threads_per_invocation if set,
+    else the CPUs split evenly across the concurrent shrinks
+    (cfg.shrink_workers), at least 1.
+    """
+    threads = getattr(cfg, "ffmpeg_threads_per_invocation", None)
+    if threads:
+        return max(1, int(threads))
+    workers = max(1, int(getattr(cfg, "shrink_workers", 1)))
+    return max(1, (os.cpu_count() or 4) // workers)
+
+
+def _parse_rate(rate: str) -> Optional[float]:
+    """Parse an ffprobe rate like '30000/1001' into fps."""
+    try:
+        if "/" in rate:
+            num, den = rate.split("/", 1)
+            return float(num) / float(den) if float(den) else None
+        return float(rate)
+    except ValueError:
+        return None
+
+
+def probe_video(
+    path: Path, timeout_s: int = 30
+) -> Tuple[Optional[int], Optional[float], Optional[float]]:
+    """
+    Read (width, fps, duration) of the first video stream with one ffprobe
+    call. Any value that can't be read (or a failed probe) comes back None.
+    """
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,r_frame_rate:format=duration",
+        "-of",
+        "json",
+        str(path),
+    ]
+    try:
+        res = subprocess.run(cmd, capture_output=True, check=True, timeout=timeout_s)
+        data = orjson.loads(res.stdout or b"{}")
+    except (OSError, subprocess.SubprocessError, orjson.JSONDecodeError):
+        return None, None, None
+
+    stream = (data.get("streams") or [{}])[0]
+    width = stream.get("width")
+    fps = _parse_rate(stream.get("r_frame_rate") or "")
+    try:
+        duration: Optional[float] = float(data.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return (width if isinstance(width, int) else None), fps, duration
 
 
 def shrink_video(cfg: Any, input_path: Path, output_path: Path) -> None:
@@ -50,20 +160,29 @@ def shrink_video(cfg: Any, input_path: Path, output_path: Path) -> None:
     - fps=cfg.shrink_fps
     - h264 + aac audio
 
+    Inputs that are already no wider than shrink_width and no faster than
+    shrink_fps are stream-copied instead (no re-encode). Otherwise decoding
+    uses -hwaccel auto (unless cfg.hwaccel is False), retried once with
+    software decode if that run fails.
+
+    Encoder threads are capped per invocation so concurrent shrinks don't
+    oversubscribe the CPU (see ffmpeg_threads).
+
     Note: cfg is typed as Any to avoid circular imports; it just needs
     the expected attributes (shrink_width, shrink_fps, crf, preset, audio_bitrate, ffmpeg_timeout_s).
     """
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    threads = ffmpeg_threads(cfg)
 
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        str(input_path),
+    encode = [
         "-vf",
         f"scale={cfg.shrink_width}:-2,fps={cfg.shrink_fps}",
+        "-threads",
+        str(threads),
         "-c:v",
         "libx264",
+        "-x264-params",
+        f"threads={threads}",
         "-crf",
         str(cfg.crf),
         "-preset",
@@ -75,18 +194,117 @@ def shrink_video(cfg: Any, input_path: Path, output_path: Path) -> None:
         str(output_path),
     ]
 
+    # Candidate commands, cheapest first; the first one that succeeds wins.
+    attempts: List[Tuple[str, List[str]]] = []
+    width, fps, _ = probe_video(input_path)
+    if width and fps and width <= cfg.shrink_width and fps <= cfg.shrink_fps:
+        attempts.append(
+            (
+                "stream copy",
+                ["ffmpeg", "-y", "-i", str(input_path), "-c", "copy", str(output_path)],
+            )
+        )
+    if getattr(cfg, "hwaccel", True):
+        attempts.append(
+            (
+                "hwaccel decode",
+                ["ffmpeg", "-y", "-hwaccel", "auto", "-i", str(input_path), *encode],
+            )
+        )
+    attempts.append(("re-encode", ["ffmpeg", "-y", "-i", str(input_path), *encode]))
+
     print(f"📦 Shrinking (with audio): {input_path.name} -> {output_path.name}")
-    run_ffmpeg(cmd, timeout_s=int(cfg.ffmpeg_timeout_s))
+    for i, (label, cmd) in enumerate(attempts):
+        try:
+            run_ffmpeg(cmd, timeout_s=int(cfg.ffmpeg_timeout_s))
+            return
+        except RuntimeError as e:
+            # a timeout would just repeat; only fall back on ffmpeg errors
+            if i == len(attempts) - 1 or not isinstance(
+                e.__cause__, subprocess.CalledProcessError
+            ):
+                raise
+            print(f"↩️ {label} failed for {input_path.name}; falling back")
 
 
 # ----------------------------- JSON persistence ---------------------------
 
 
+def journal_path(log_file: Path) -> Path:
+    """NDJSON sidecar holding records newer than the log_file snapshot."""
+    return log_file.with_suffix(".ndjson")
+
+
+def append_record(journal: Path, asset_key: str, record: Dict[str, Any]) -> None:
+    """
+    Append one record to the journal: O(1), unlike a full write_results.
+
+    The line goes out via os.write on an O_APPEND descriptor rather than a
+    buffered file object: one write syscall per record in practice, with
+    no per-append mkdir/fstat/lseek.
+    """
+    line = orjson.dumps(
+        {"asset_key": asset_key, "record": record}, option=orjson.OPT_APPEND_NEWLINE
+    )
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    try:
+        fd = os.open(journal, flags, 0o644)
+    except FileNotFoundError:
+        journal.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(journal, flags, 0o644)
+    try:
+        view = memoryview(line)
+        while view:  # os.write may be partial (e.g. on signals)
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+
+
+def _replay_journal(journal: Path, by_asset_key: Dict[str, Any]) -> int:
+    """Apply journal records over the snapshot; returns how many were applied."""
+    if not journal.exists():
+        return 0
+
+    n = 0
+    with journal.open("rb") as f:
+        for line in f:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # torn last line from a crash mid-append
+            if isinstance(entry, dict) and entry.get("asset_key"):
+                by_asset_key[entry["asset_key"]] = entry.get("record")
+                n += 1
+    return n
+
+
 def load_existing_results(log_file: Path) -> Dict[str, Any]:
+    """
+    Load the results snapshot, then replay any newer records from the
+    NDJSON journal (see append_record) on top of it.
+
+    A leftover journal is folded into the snapshot right away (and so
+    cleared): the merge reads only the snapshot, a rerun with nothing to
+    do would never write it, and new appends must not land on a torn
+    last line.
+    """
+    store = _load_snapshot(log_file)
+    journal = journal_path(log_file)
+    if not journal.exists():
+        return store
+
+    n = _replay_journal(journal, store["by_asset_key"])
+    if n:
+        print(f"↪️ Recovered {n} record(s) from {journal.name}")
+    write_results(log_file, store)
+    return store
+
+
+def _load_snapshot(log_file: Path) -> Dict[str, Any]:
     if not log_file.exists():
         return {"by_asset_key": {}}
 
-    data = json.loads(log_file.read_text(encoding="utf-8"))
+    data = read_json(log_file)
 
     # New format
     if isinstance(data, dict) and isinstance(data.get("by_asset_key"), dict):
@@ -110,48 +328,205 @@ def load_existing_results(log_file: Path) -> Dict[str, Any]:
 
 def write_results(log_file: Path, data: Dict[str, Any]) -> None:
     """
-    Atomically-ish write results JSON (simple overwrite).
-    Ensures parent directory exists.
+    Atomically write the full results JSON snapshot (tmp file + os.replace),
+    then clear the journal, whose records the snapshot now contains.
+    Ensures parent directory exists. Expired uploads are dropped from
+    data["by_hash"] first, so the upload cache doesn't grow without bound.
     """
+    by_hash = data.get("by_hash")
+    if isinstance(by_hash, dict):
+        now = datetime.now(timezone.utc)
+        for digest in [d for d, e in by_hash.items() if _upload_expired(e, now)]:
+            del by_hash[digest]
+
     log_file.parent.mkdir(parents=True, exist_ok=True)
-    log_file.write_text(
-        json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8"
+    tmp = log_file.with_suffix(log_file.suffix + ".tmp")
+    # Same bytes as json.dumps(..., ensure_ascii=False, indent=2) + "\n"
+    tmp.write_bytes(
+        orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
     )
+    os.replace(tmp, log_file)
+    journal_path(log_file).unlink(missing_ok=True)
 
 
 # ----------------------------- Gemini polling -----------------------------
 
 
+def _is_ready(cfg: Any, uploaded_file: Any, start: float) -> bool:
+    """
+    True once the file has left PROCESSING. Raises if it FAILED or the
+    cfg.processing_max_wait_s budget (measured from `start`) is used up.
+    """
+    state = getattr(uploaded_file, "state", None)
+    state_name = getattr(state, "name", None)
+
+    # Some SDKs might represent state differently; fall back to string.
+    if state_name is None and state is not None:
+        state_name = str(state)
+
+    if state_name and str(state_name).upper() == "FAILED":
+        raise RuntimeError(f"❌ Video processing failed: state={state_name}")
+
+    # If not processing, consider it ready.
+    if state_name and str(state_name).upper() != "PROCESSING":
+        return True
+
+    if time.time() - start > float(cfg.processing_max_wait_s):
+        raise RuntimeError(
+            f"❌ Upload processing exceeded max wait ({cfg.processing_max_wait_s}s)"
+        )
+    return False
+
+
+def _poll_delay(cfg: Any, attempt: int) -> float:
+    """0.25s, 0.5s, 1s, ... capped at cfg.upload_poll_s, plus <=0.1s jitter."""
+    delay = min(float(cfg.upload_poll_s), 0.25 * (2**attempt))
+    return delay + random.uniform(0, 0.1)
+
+
 def wait_until_ready(cfg: Any, client: genai.Client, uploaded_file: Any) -> Any:
     """
     Poll Gemini file state until ready or failed, with a max wait.
 
+    Returns immediately (no files.get) when the upload is already ACTIVE.
+    Otherwise polls with exponential backoff: 0.25s, 0.5s, 1s, ... capped at
+    cfg.upload_poll_s, plus up to 0.1s of jitter so parallel workers don't
+    poll in lockstep.
+
     Note: cfg is typed as Any to avoid circular imports; it just needs:
       - upload_poll_s
       - processing_max_wait_s
     """
     start = time.time()
+    attempt = 0
 
-    while True:
-        state = getattr(uploaded_file, "state", None)
-        state_name = getattr(state, "name", None)
-
-        # Some SDKs might represent state differently; fall back to string.
-        if state_name is None and state is not None:
-            state_name = str(state)
+    while not _is_ready(cfg, uploaded_file, start):
+        print("⏳ Processing video frames...", end="\r")
+        time.sleep(_poll_delay(cfg, attempt))
+        attempt += 1
+        uploaded_file = client.files.get(name=uploaded_file.name)
 
-        if state_name and str(state_name).upper() == "FAILED":
-            raise RuntimeError(f"❌ Video processing failed: state={state_name}")
+    return uploaded_file
 
-        # If not processing, consider it ready.
-        if state_name and str(state_name).upper() != "PROCESSING":
-            return uploaded_file
 
-        if time.time() - start > float(cfg.processing_max_wait_s):
-            raise RuntimeError(
-                f"❌ Upload processing exceeded max wait ({cfg.processing_max_wait_s}s)"
-            )
+async def wait_until_ready_async(
+    cfg: Any, client: genai.Client, uploaded_file: Any
+) -> Any:
+    """wait_until_ready on the event loop, polling via client.aio."""
+    start = time.time()
+    attempt = 0
 
+    while not _is_ready(cfg, uploaded_file, start):
         print("⏳ Processing video frames...", end="\r")
-        time.sleep(float(cfg.upload_poll_s))
-        uploaded_file = client.files.get(name=uploaded_file.name)
+        await asyncio.sleep(_poll_delay(cfg, attempt))
+        attempt += 1
+        uploaded_file = await client.aio.files.get(name=uploaded_file.name)
+
+    return uploaded_file
+
+
+# ----------------------------- Gemini uploads -----------------------------
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, streamed in chunks (no whole-file read)."""
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _upload_expired(entry: Any, now: datetime) -> bool:
+    """True if a by_hash entry is unusable or its expiration_time has passed."""
+    if not isinstance(entry, dict) or not entry.get("name"):
+        return True
+
+    expires = entry.get("expiration_time")
+    if expires:
+        try:
+            return datetime.fromisoformat(expires) <= now
+        except (TypeError, ValueError):
+            pass
+    return False
+
+
+async def _reuse_upload_async(client: genai.Client, entry: Any) -> Any:
+    """Return the cached upload if it is unexpired and still ACTIVE, else None."""
+    if _upload_expired(entry, datetime.now(timezone.utc)):
+        return None
+
+    try:
+        f = await client.aio.files.get(name=entry["name"])
+    except Exception:
+        return None  # deleted or expired server-side
+    state = getattr(getattr(f, "state", None), "name", None)
+    return f if state == "ACTIVE" else None
+
+
+UPLOAD_ATTEMPTS = 3
+
+# Failures worth another upload attempt: 5xx from Gemini, or network-level
+# errors from whichever HTTP client the SDK's async side is using.
+_TRANSIENT_UPLOAD_ERRORS: Tuple[type, ...] = (
+    genai_errors.ServerError,
+    httpx.TransportError,
+) + ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+
+async def upload_with_retry_async(
+    client: genai.Client, path: Path, attempts: int = UPLOAD_ATTEMPTS
+) -> Any:
+    """
+    client.aio.files.upload with up to `attempts` tries, sleeping 2**attempt
+    seconds (1s, 2s, ...) after a transient failure: a 5xx from Gemini or a
+    network-level error. Other errors are raised immediately.
+
+    The SDK already uploads with Gemini's resumable protocol in 8 MB chunks
+    (retrying individual chunks); this covers failures that escape it, such
+    as the upload session failing to start.
+    """
+    for attempt in range(attempts):
+        try:
+            return await client.aio.files.upload(file=str(path))
+        except _TRANSIENT_UPLOAD_ERRORS as e:
+            if attempt == attempts - 1:
+                raise
+            delay = 2**attempt
+            print(f"⚠️ Upload of {path.name} failed ({e}); retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def upload_or_reuse_async(
+    cfg: Any,
+    client: genai.Client,
+    path: Path,
+    by_hash: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Upload `path` to Gemini and wait until it is ready, unless an identical
+    file (same SHA-256) was uploaded earlier and is still ACTIVE there; its
+    File handle is reused instead. New uploads are recorded in `by_hash`
+    (name, uri, mime_type, expiration_time). Pass by_hash=None to always
+    upload, e.g. when uploads are deleted after use.
+    """
+    digest = None
+    if by_hash is not None:
+        digest = await asyncio.to_thread(file_sha256, path)
+        reused = await _reuse_upload_async(client, by_hash.get(digest))
+        if reused is not None:
+            print(f"♻️ Reusing upload {reused.name} for {path.name}")
+            return reused
+
+    uploaded = await upload_with_retry_async(client, path)
+    uploaded = await wait_until_ready_async(cfg, client, uploaded)
+
+    if digest is not None:
+        expires = getattr(uploaded, "expiration_time", None)
+        by_hash[digest] = {
+            "name": uploaded.name,
+            "uri": getattr(uploaded, "uri", None),
+            "mime_type": getattr(uploaded, "mime_type", None),
+            "expiration_time": expires.isoformat() if expires else None,
+        }
+    return uploaded